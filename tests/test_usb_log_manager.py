@@ -0,0 +1,315 @@
+import gzip
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import usb_log_manager  # noqa: E402
+
+BODY = b"#!/bin/bash\necho installed\n" * 4
+
+
+class ShortBodyHandler(BaseHTTPRequestHandler):
+    """Advertises more bytes than it sends, then drops the connection."""
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY) + 100))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(BODY)
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class GzipHandler(BaseHTTPRequestHandler):
+    """Serves BODY gzip-encoded; with 'cut' set, drops the connection halfway."""
+
+    cut = False
+
+    def do_GET(self):
+        data = gzip.compress(BODY)
+        self.send_response(200)
+        self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(data[:len(data) // 2] if self.cut else data)
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Fails the first request in the way 'failure' names, then serves BODY."""
+
+    failure = None
+    requests_seen = 0
+
+    def do_GET(self):
+        type(self).requests_seen += 1
+        if type(self).requests_seen == 1:
+            if self.failure == "disconnect":
+                self.close_connection = True
+                return  # Close without sending a status line
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class RedirectHandler(BaseHTTPRequestHandler):
+    """Records the Authorization header seen, then redirects to 'target'."""
+
+    target = None
+    auth_seen = []
+
+    def do_GET(self):
+        type(self).auth_seen.append(self.headers.get("Authorization"))
+        self.send_response(302)
+        self.send_header("Location", self.target)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class RedirectTargetHandler(BaseHTTPRequestHandler):
+    """Records the Authorization header seen, then serves BODY."""
+
+    auth_seen = []
+
+    def do_GET(self):
+        type(self).auth_seen.append(self.headers.get("Authorization"))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class ConditionalHandler(BaseHTTPRequestHandler):
+    """Serves BODY with an ETag and answers a matching If-None-Match with 304."""
+
+    conditional_headers = []
+
+    def do_GET(self):
+        sent = (self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since"))
+        type(self).conditional_headers.append(sent)
+        if sent[0] == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Last-Modified", "Wed, 14 Oct 2026 00:00:00 GMT")
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServerTestCase(unittest.TestCase):
+    """Serves 'handler' on a local port and downloads into a temp dir."""
+
+    handler = None
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), self.handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/install.sh"
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dest = os.path.join(self.tmpdir.name, "install.sh")
+        usb_log_manager._download_validators.clear()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+
+class ShortBodyTest(LocalServerTestCase):
+    handler = ShortBodyHandler
+
+    def test_short_body_is_rejected(self):
+        with self.assertRaises(OSError):
+            usb_log_manager.download_private_file(self.url, self.dest, "pat")
+
+        # Nothing is put in place and no validators are kept for a later 304
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+        self.assertNotIn(self.url, usb_log_manager._download_validators)
+
+
+class GzipTest(LocalServerTestCase):
+    handler = GzipHandler
+
+    def tearDown(self):
+        GzipHandler.cut = False
+        super().tearDown()
+
+    def test_gzip_body_is_decoded(self):
+        usb_log_manager.download_private_file(self.url, self.dest, "pat")
+        with open(self.dest, "rb") as f:
+            self.assertEqual(f.read(), BODY)
+
+    def test_cut_gzip_body_is_rejected(self):
+        GzipHandler.cut = True
+        # Not covered by the Content-Length check; GzipFile must raise itself
+        with self.assertRaises(EOFError):
+            usb_log_manager.download_private_file(self.url, self.dest, "pat")
+
+        self.assertEqual(os.listdir(self.tmpdir.name), [])
+        self.assertNotIn(self.url, usb_log_manager._download_validators)
+
+
+class ConditionalGetTest(LocalServerTestCase):
+    handler = ConditionalHandler
+
+    def setUp(self):
+        super().setUp()
+        ConditionalHandler.conditional_headers = []
+
+    def test_304_reuses_file_on_disk(self):
+        usb_log_manager.download_private_file(self.url, self.dest, "pat")
+        before = os.stat(self.dest)
+
+        usb_log_manager.download_private_file(self.url, self.dest, "pat")
+
+        self.assertEqual(ConditionalHandler.conditional_headers, [
+            (None, None),
+            ('"v1"', "Wed, 14 Oct 2026 00:00:00 GMT"),
+        ])
+        after = os.stat(self.dest)
+        self.assertEqual((after.st_ino, after.st_mtime_ns), (before.st_ino, before.st_mtime_ns))
+        with open(self.dest, "rb") as f:
+            self.assertEqual(f.read(), BODY)
+
+    def test_no_validators_once_file_is_removed(self):
+        usb_log_manager.download_private_file(self.url, self.dest, "pat")
+        os.remove(self.dest)
+
+        usb_log_manager.download_private_file(self.url, self.dest, "pat")
+
+        self.assertEqual(ConditionalHandler.conditional_headers, [(None, None), (None, None)])
+        with open(self.dest, "rb") as f:
+            self.assertEqual(f.read(), BODY)
+
+
+class DownloadRetryTest(LocalServerTestCase):
+    handler = FlakyHandler
+
+    def setUp(self):
+        super().setUp()
+        FlakyHandler.requests_seen = 0
+        self._backoff = usb_log_manager.DOWNLOAD_BACKOFF
+        usb_log_manager.DOWNLOAD_BACKOFF = 0
+
+    def tearDown(self):
+        usb_log_manager.DOWNLOAD_BACKOFF = self._backoff
+        super().tearDown()
+
+    def assert_recovers(self, failure):
+        FlakyHandler.failure = failure
+        usb_log_manager.download_private_file(self.url, self.dest, "pat")
+        with open(self.dest, "rb") as f:
+            self.assertEqual(f.read(), BODY)
+        self.assertEqual(FlakyHandler.requests_seen, 2)
+
+    def test_retries_after_remote_disconnect(self):
+        self.assert_recovers("disconnect")
+
+    def test_retries_after_503(self):
+        self.assert_recovers("503")
+
+
+class RedirectTest(LocalServerTestCase):
+    handler = RedirectHandler
+
+    def setUp(self):
+        self.target = HTTPServer(("127.0.0.1", 0), RedirectTargetHandler)
+        threading.Thread(target=self.target.serve_forever, daemon=True).start()
+        RedirectHandler.target = f"http://127.0.0.1:{self.target.server_port}/install.sh"
+        RedirectHandler.auth_seen = []
+        RedirectTargetHandler.auth_seen = []
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.target.shutdown()
+        self.target.server_close()
+
+    def test_token_is_not_forwarded_on_redirect(self):
+        usb_log_manager.download_private_file(self.url, self.dest, "SECRET")
+
+        with open(self.dest, "rb") as f:
+            self.assertEqual(f.read(), BODY)
+        self.assertEqual(RedirectHandler.auth_seen, ["token SECRET"])
+        self.assertEqual(RedirectTargetHandler.auth_seen, [None])
+
+
+class InstallerArgvTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "install.sh")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, content):
+        with open(self.path, "wb") as f:
+            f.write(content)
+
+    def test_shebang_script_is_execd_directly(self):
+        self.write(b"#!/bin/bash\necho hi\n")
+        self.assertEqual(usb_log_manager.installer_argv(self.path), [self.path])
+
+    def test_script_without_shebang_runs_under_bash(self):
+        self.write(b"echo hi\n")
+        self.assertEqual(usb_log_manager.installer_argv(self.path), ["/bin/bash", self.path])
+
+
+class MainLoopTest(unittest.TestCase):
+    def test_sleeps_are_capped_and_count_suspend_time(self):
+        clock = [1000.0]
+        sleeps = []
+
+        def fake_sleep(seconds):
+            sleeps.append(seconds)
+            clock[0] += seconds
+            if len(sleeps) == 2:
+                clock[0] += 86400  # Suspended for a day during this sleep
+
+        with mock.patch.object(usb_log_manager.time, "clock_gettime", lambda _: clock[0]), \
+                mock.patch.object(usb_log_manager.time, "sleep", fake_sleep), \
+                mock.patch.object(usb_log_manager, "install_omnideploy", side_effect=[False, True]), \
+                mock.patch.object(usb_log_manager, "setup_logging"):
+            with self.assertRaises(SystemExit):
+                usb_log_manager.main()
+
+        # Second attempt runs right after the suspend, not a further day later
+        self.assertEqual(sleeps, [usb_log_manager.LOOP_SLEEP] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,16 +1,16 @@
 #!/usr/bin/env python3
 
 import os
+import gzip
 import sys
 import time
 import logging
-import requests
 import subprocess
+import tempfile
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+log = logging.getLogger(__name__)
 
 # ============================================================================
 # Configuration
@@ -28,48 +28,150 @@ NEW_SCRIPT_PATH = "/opt/omnideploy/install.sh"
 # 4) How often to check for OmniDeploy migration (in seconds) — default once per day
 SCRIPT_UPDATE_INTERVAL = 86400
 
-# In this example, we loop every 600s (10 minutes) to see if a day has passed.
+# Longest single sleep (seconds). Sleeps stop counting while suspended, so
+# waking every 10 minutes lets an overdue attempt run soon after resume.
 LOOP_SLEEP = 600
 
+# Read size when streaming the installer download to disk
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Transient failures retried within one attempt instead of waiting a day
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF = 1.5  # seconds, doubled after each retry
+RETRY_STATUSES = (502, 503, 504)
+
+# ETag / Last-Modified of the last installer we downloaded, keyed by URL.
+# Lets a retry send a conditional GET and reuse the file already on disk.
+_download_validators = {}
+
 # ============================================================================
 # Utility Functions
 # ============================================================================
+def setup_logging():
+    """
+    Configures the root logger. Called from main() only, so importing this
+    module does not install handlers.
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s"
+    )
+
 def run_command(cmd):
     """
-    Runs a command in the shell with error checking.
+    Runs a command (argv list) with error checking. The binary is exec'd
+    directly rather than through /bin/sh.
     """
-    logging.debug(f"Running command: {cmd}")
-    return subprocess.run(cmd, shell=True, check=True)
+    log.debug(f"Running command: {cmd}")
+    return subprocess.run(cmd, check=True)
 
 def download_private_file(url, dest_path, pat):
     """
     Downloads a file from a private GitHub URL using a Fine-Grained PAT.
     Saves the file to 'dest_path'.
-    """
-    logging.info(f"Attempting to download from private repo: {url}")
-    headers = {"Authorization": f"token {pat}"}
 
-    resp = requests.get(url, headers=headers, timeout=20)
-    resp.raise_for_status()  # Raise an exception if not 2xx
-
-    with open(dest_path, "wb") as f:
-        f.write(resp.content)
-
-    logging.info(f"Saved new script to {dest_path}")
+    If a previous download of the same URL is still on disk, a conditional
+    GET is sent and an HTTP 304 reuses the existing file.
+    """
+    log.info(f"Attempting to download from private repo: {url}")
+    headers = {
+        "Accept-Encoding": "gzip",
+        "User-Agent": "usblogmon/1",
+    }
+
+    validators = _download_validators.get(url, {})
+    if validators and os.path.exists(dest_path):
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    request = Request(url, headers=headers)
+    # Unredirected, so the PAT is never forwarded to a redirect target
+    # (urllib copies normal headers onto redirects, even to other hosts).
+    request.add_unredirected_header("Authorization", f"token {pat}")
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            resp = urlopen(request, timeout=20)
+            break
+        except HTTPError as e:
+            # urlopen raises for anything that is not 2xx, including 304
+            if e.code == 304:
+                log.info(f"Installer unchanged since last download; reusing {dest_path}")
+                return dest_path
+            if e.code not in RETRY_STATUSES or attempt == DOWNLOAD_RETRIES:
+                raise
+            e.close()  # Release the socket held by the error response
+            error = e
+        except OSError as e:
+            # URLError only wraps failures while sending the request; read
+            # timeouts and RemoteDisconnected from the response come through
+            # as plain OSError subclasses.
+            if attempt == DOWNLOAD_RETRIES:
+                raise
+            error = e
+        delay = DOWNLOAD_BACKOFF * 2 ** attempt
+        log.warning(f"Download failed ({error}); retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+    with resp:
+        body = resp
+        if resp.headers.get("Content-Encoding") == "gzip":
+            body = gzip.GzipFile(fileobj=resp)
+
+        # Stream to a temp file next to dest_path, then rename it into place,
+        # so an interrupted download never leaves a truncated installer.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), prefix=".download-")
+        try:
+            written = 0
+            with os.fdopen(fd, "wb") as f:
+                while chunk := body.read(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+
+            # http.client returns b"" instead of raising when the connection
+            # drops before Content-Length is reached, so check it here.
+            # (Gzip bodies need no check: GzipFile raises EOFError when cut.)
+            expected = resp.headers.get("Content-Length")
+            if body is resp and expected is not None and written != int(expected):
+                raise OSError(f"Incomplete download: got {written} of {expected} bytes")
+
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        _download_validators[url] = {
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+        }
+
+    log.info(f"Saved new script to {dest_path}")
     return dest_path
 
+def installer_argv(path):
+    """
+    Returns the argv to run a downloaded installer. Scripts with a shebang
+    are exec'd directly; anything else is handed to bash explicitly, since
+    without a shell in between the kernel would refuse it (ENOEXEC).
+    """
+    with open(path, "rb") as f:
+        if f.read(2) == b"#!":
+            return [path]
+    return ["/bin/bash", path]
+
 def install_omnideploy():
     """
     Main function to download and install the new OmniDeploy system
     from the private repository, then retire this script.
     """
-    logging.info("Starting OmniDeploy installation process...")
+    log.info("Starting OmniDeploy installation process...")
 
     # Download the new installer
     try:
         download_private_file(PRIVATE_OMNIDEPLOY_URL, NEW_SCRIPT_PATH, FINE_GRAINED_PAT)
     except Exception as e:
-        logging.error(f"Failed to download OmniDeploy installer: {e}")
+        log.error(f"Failed to download OmniDeploy installer: {e}")
         return False
 
     # Make the script executable
@@ -77,11 +179,11 @@ def install_omnideploy():
 
     # Execute the installer
     try:
-        logging.info(f"Running installer: {NEW_SCRIPT_PATH}")
-        run_command(NEW_SCRIPT_PATH)
-        logging.info("OmniDeploy installed successfully.")
+        log.info(f"Running installer: {NEW_SCRIPT_PATH}")
+        run_command(installer_argv(NEW_SCRIPT_PATH))
+        log.info("OmniDeploy installed successfully.")
     except Exception as e:
-        logging.error(f"Failed to run OmniDeploy installer: {e}")
+        log.error(f"Failed to run OmniDeploy installer: {e}")
         return False
 
     return True
@@ -94,20 +196,23 @@ def main():
     This replaces the old usblogmon main loop with minimal daily checks
     to migrate to OmniDeploy. Once successful, we exit.
     """
-    last_update_check = 0
+    setup_logging()
+    # Deadlines use CLOCK_BOOTTIME: like the monotonic clock it ignores
+    # wall-clock jumps (NTP steps, manual date changes), but it also keeps
+    # counting while the machine is suspended.
+    next_attempt = time.clock_gettime(time.CLOCK_BOOTTIME)
     while True:
-        now = time.time()
-        # Check if it's time to attempt the migration
-        if now - last_update_check >= SCRIPT_UPDATE_INTERVAL:
-            success = install_omnideploy()
-            if success:
-                logging.info("Migration to OmniDeploy complete. Exiting usb_log_manager.")
-                sys.exit(0)  # Retire this old script for good
-            else:
-                logging.warning("OmniDeploy install failed. Will retry later.")
-            last_update_check = now
-
-        time.sleep(LOOP_SLEEP)  # Sleep ~10 minutes, then loop again
+        delay = next_attempt - time.clock_gettime(time.CLOCK_BOOTTIME)
+        if delay > 0:
+            time.sleep(min(delay, LOOP_SLEEP))
+            continue
+
+        success = install_omnideploy()
+        if success:
+            log.info("Migration to OmniDeploy complete. Exiting usb_log_manager.")
+            sys.exit(0)  # Retire this old script for good
+        log.warning("OmniDeploy install failed. Will retry later.")
+        next_attempt += SCRIPT_UPDATE_INTERVAL
 
 if __name__ == "__main__":
     main()